@@ -1,35 +1,132 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, g, has_request_context
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, Computed, event, func, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 from datetime import datetime
 import os
-import random
-import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from celery import Celery
+from celery.signals import worker_process_shutdown
 from dotenv import load_dotenv
-from scraper_engine import ScrapingEngine
+from werkzeug.exceptions import HTTPException
+from scraper_engine import ScrapingEngine, shutdown_driver_pools
 
 load_dotenv()
 
+class OrjsonProvider(JSONProvider):
+    """Serialize JSON responses with orjson, encoding naive datetimes as UTC"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key-for-development')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'postgresql://localhost/scraper_dashboard')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_pre_ping': True,
+    'pool_size': 10,
+    'max_overflow': 20,
+    # Use orjson wherever SQLAlchemy (de)serializes JSONB columns such as JobRun.results
+    'json_serializer': lambda obj: orjson.dumps(obj).decode(),
+    'json_deserializer': orjson.loads,
+}
+app.config['COUNT_QUERIES'] = os.getenv('COUNT_QUERIES', '').lower() in ('1', 'true', 'yes')
+
+# Keep every compiled template in memory; auto_reload already follows debug mode
+app.jinja_options = {**app.jinja_options, 'cache_size': -1}
 
 db = SQLAlchemy(app)
 
+# With REDIS_URL set, scrapes run on Celery workers consuming the 'scraping' queue, e.g.
+# celery -A app.celery worker -Q scraping
+# Without a broker they run in-process on a bounded thread pool instead.
+REDIS_URL = os.getenv('REDIS_URL')
+celery = Celery('scraper', broker=REDIS_URL)
+celery.conf.task_routes = {'run_scraping_task': {'queue': 'scraping'}}
+SCRAPE_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('SCRAPE_WORKERS', '4')))
+
+@worker_process_shutdown.connect
+def quit_idle_drivers(**kwargs):
+    """Prefork children can exit without running atexit hooks, so quit pooled Chrome here too"""
+    shutdown_driver_pools()
+
+SHORT_ID_CANDIDATES = 32
+SHORT_ID_ATTEMPTS = 3
+
+# Draws a batch of random 5-digit IDs and returns the first one not already taken
+FREE_SHORT_ID_SQL = text("""
+    SELECT candidate FROM (
+        SELECT (floor(random() * 90000) + 10000)::int::text AS candidate
+        FROM generate_series(1, :candidates)
+    ) AS c
+    WHERE NOT EXISTS (SELECT 1 FROM job WHERE job.id = c.candidate)
+    LIMIT 1
+""")
+
 def generate_short_id():
-    """Generate a 5-digit unique ID"""
-    while True:
-        new_id = str(random.randint(10000, 99999))
-        # Check if this ID already exists
-        if not Job.query.filter_by(id=new_id).first():
+    """Generate a 5-digit unique ID in a single round trip"""
+    for _ in range(SHORT_ID_ATTEMPTS):
+        new_id = db.session.execute(FREE_SHORT_ID_SQL, {'candidates': SHORT_ID_CANDIDATES}).scalar()
+        if new_id:
             return new_id
+    raise RuntimeError('No free job IDs available')
+
+JOBS_PAGE_SIZE = 50
+
+def encode_cursor(job):
+    """Build the keyset cursor that resumes the job list after this job"""
+    return f'{job.created_at.isoformat()}_{job.id}'
+
+def decode_cursor(cursor):
+    """Split a keyset cursor back into its (created_at, id) pair"""
+    created_at, _, job_id = cursor.rpartition('_')
+    return datetime.fromisoformat(created_at), job_id
+
+def build_search_filter(search_query):
+    """Build a full-text filter with prefix matching plus a trigram substring fallback"""
+    # Quote each term so the 'simple' parser tokenizes it the way it tokenized the
+    # stored text, e.g. a domain stays a single example.com lexeme
+    terms = ["'" + term.replace('\\', '\\\\').replace("'", "''") + "':*" for term in search_query.split()]
+    
+    pattern = '%' + search_query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    substring_match = db.or_(
+        Job.name.ilike(pattern, escape='\\'),
+        Job.url.ilike(pattern, escape='\\'),
+        Job.id.ilike(pattern, escape='\\')
+    )
+    if not terms:
+        return substring_match
+    
+    ts_query = func.to_tsquery('simple', ' & '.join(terms))
+    return db.or_(Job.searchable.op('@@')(ts_query), substring_match)
 
 class Job(db.Model):
     id = db.Column(db.String(5), primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     url = db.Column(db.Text, nullable=False)
     selenium_instructions = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=text("(now() at time zone 'utc')"))
+    # Only used in search filters, so leave it out of the SELECT list of every Job load
+    searchable = deferred(db.Column(TSVECTOR, Computed(
+        "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(url, '') || ' ' || id)",
+        persisted=True
+    )))
+    
+    __table_args__ = (
+        db.Index('ix_job_created', 'created_at', 'id'),
+        db.Index('job_fts', 'searchable', postgresql_using='gin'),
+        db.Index('job_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('job_url_trgm', 'url', postgresql_using='gin', postgresql_ops={'url': 'gin_trgm_ops'}),
+        db.Index('job_id_trgm', 'id', postgresql_using='gin', postgresql_ops={'id': 'gin_trgm_ops'}),
+    )
     
     def to_dict(self):
         return {
@@ -37,34 +134,103 @@ class Job(db.Model):
             'name': self.name,
             'url': self.url,
             'selenium_instructions': self.selenium_instructions,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': self.created_at
         }
 
 class JobRun(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.String(5), db.ForeignKey('job.id'), nullable=False)
     status = db.Column(db.String(20), default='running')  # running, completed, failed
-    results = db.Column(db.Text)  # JSON string of results
+    results = db.Column(JSONB)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
     
     job = db.relationship('Job', backref=db.backref('runs', lazy=True))
 
+# Serves the latest-runs-per-job lookup straight from the index
+db.Index('ix_jobrun_job_started', JobRun.job_id, JobRun.started_at.desc())
+
+# Leave free space in each page so the status/results/completed_at update that finishes
+# a run can stay HOT; that only holds while none of those columns is indexed.
+# Also keep a job's runs physically together in started_at order. CLUSTER is a one-off
+# rewrite, so re-run CLUSTER job_run (or pg_repack) periodically as runs accumulate.
+event.listen(JobRun.__table__, 'after_create', DDL('ALTER TABLE job_run SET (fillfactor = 90)'))
+event.listen(JobRun.__table__, 'after_create', DDL('ALTER TABLE job_run CLUSTER ON ix_jobrun_job_started'))
+
+# gin_trgm_ops used by the *_trgm indexes needs pg_trgm installed before the table is created
+event.listen(Job.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    """Count the SQL statements issued while handling the current request"""
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def add_query_count_header(response):
+    """Expose the per-request statement count so N+1 regressions show up in responses"""
+    response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+    return response
+
+def enable_query_counting():
+    """Count statements per request and report them in an X-Query-Count header (debug/testing only)"""
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_queries)
+    app.after_request(add_query_count_header)
+
+if app.config['COUNT_QUERIES']:
+    enable_query_counting()
+
+def finish_job_run(job_run_id, status, results):
+    """Record a run's outcome in a single UPDATE, bypassing the ORM unit of work"""
+    db.session.execute(
+        update(JobRun).where(JobRun.id == job_run_id).values(
+            status=status,
+            results=results,
+            completed_at=datetime.utcnow()
+        )
+    )
+    db.session.commit()
+
+@celery.task(name='run_scraping_task')
+def run_scraping_task(job_run_id, job_data):
+    """Run a scraping job on a worker and record the outcome on its JobRun"""
+    with app.app_context():
+        try:
+            engine = ScrapingEngine(headless=True)
+            result = engine.run_scraping_job(job_data)
+            finish_job_run(job_run_id, 'completed' if result['status'] == 'success' else 'failed', result)
+        except Exception as e:
+            # Nothing waits on the task's outcome, so log it and never leave the run 'running'
+            app.logger.exception('Scraping job run %s failed', job_run_id)
+            db.session.rollback()
+            try:
+                finish_job_run(job_run_id, 'failed', {'status': 'error', 'message': f'Error running job: {str(e)}'})
+            except Exception:
+                app.logger.exception('Could not mark job run %s as failed', job_run_id)
+
 @app.route('/')
 def index():
     search_query = request.args.get('search', '')
+    after = request.args.get('after', '')
+    
+    stmt = select(Job)
     if search_query:
-        jobs = Job.query.filter(
-            db.or_(
-                Job.name.contains(search_query),
-                Job.url.contains(search_query),
-                Job.id.contains(search_query)
-            )
-        ).order_by(Job.created_at.desc()).all()
-    else:
-        jobs = Job.query.order_by(Job.created_at.desc()).all()
+        stmt = stmt.where(build_search_filter(search_query))
+    if after:
+        try:
+            stmt = stmt.where(tuple_(Job.created_at, Job.id) < decode_cursor(after))
+        except ValueError:
+            after = ''
+    
+    # Fetch one extra row to learn whether an older page exists
+    jobs = db.session.scalars(
+        stmt.order_by(Job.created_at.desc(), Job.id.desc()).limit(JOBS_PAGE_SIZE + 1)
+    ).all()
+    next_cursor = None
+    if len(jobs) > JOBS_PAGE_SIZE:
+        jobs = jobs[:JOBS_PAGE_SIZE]
+        next_cursor = encode_cursor(jobs[-1])
     
-    return render_template('index.html', jobs=jobs, search_query=search_query)
+    return render_template('index.html', jobs=jobs, search_query=search_query, after=after, next_cursor=next_cursor)
 
 @app.route('/create_job', methods=['POST'])
 def create_job():
@@ -94,10 +260,39 @@ def create_job():
         flash(f'Error creating job: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+@app.route('/import_jobs', methods=['POST'])
+def import_jobs():
+    """Bulk-load jobs from an uploaded CSV of id,name,url,selenium_instructions rows"""
+    try:
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('A CSV file is required to import jobs', 'error')
+            return redirect(url_for('index'))
+        
+        # Stream the upload straight into COPY instead of inserting row by row
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                'COPY job (id, name, url, selenium_instructions) FROM STDIN WITH (FORMAT csv, HEADER true)',
+                stream=upload.stream
+            )
+            imported = cursor.rowcount
+            connection.commit()
+        finally:
+            connection.close()
+        
+        flash(f'Imported {imported} jobs successfully!', 'success')
+        
+    except Exception as e:
+        flash(f'Error importing jobs: {str(e)}', 'error')
+    
+    return redirect(url_for('index'))
+
 @app.route('/update_job/<job_id>', methods=['POST'])
 def update_job(job_id):
     try:
-        job = Job.query.get_or_404(job_id)
+        job = db.get_or_404(Job, job_id)
         
         job.name = request.form.get('name', job.name)
         job.url = request.form.get('url', job.url)
@@ -114,7 +309,7 @@ def update_job(job_id):
 @app.route('/delete_job/<job_id>', methods=['POST'])
 def delete_job(job_id):
     try:
-        job = Job.query.get_or_404(job_id)
+        job = db.get_or_404(Job, job_id)
         db.session.delete(job)
         db.session.commit()
         flash('Job deleted successfully!', 'success')
@@ -128,27 +323,18 @@ def delete_job(job_id):
 def run_job(job_id):
     """Execute a scraping job"""
     try:
-        job = Job.query.get_or_404(job_id)
+        job = db.get_or_404(Job, job_id)
         
         # Create a new job run record
         job_run = JobRun(job_id=job_id, status='running')
         db.session.add(job_run)
         db.session.commit()
         
-        # Execute scraping in a separate thread
-        def execute_scraping():
-            engine = ScrapingEngine(headless=True)
-            job_data = job.to_dict()
-            result = engine.run_scraping_job(job_data)
-            
-            # Update job run with results
-            job_run.status = 'completed' if result['status'] == 'success' else 'failed'
-            job_run.results = str(result)
-            job_run.completed_at = datetime.utcnow()
-            db.session.commit()
-        
-        # Start scraping in background
-        threading.Thread(target=execute_scraping, daemon=True).start()
+        # Hand the scrape off to a Celery worker, or to the local pool without a broker
+        if REDIS_URL:
+            run_scraping_task.delay(job_run.id, job.to_dict())
+        else:
+            SCRAPE_POOL.submit(run_scraping_task, job_run.id, job.to_dict())
         
         flash(f'Scraping job {job_id} started successfully!', 'success')
         return redirect(url_for('index'))
@@ -161,25 +347,34 @@ def run_job(job_id):
 def job_status(job_id):
     """Get the status of recent job runs"""
     try:
-        job = Job.query.get_or_404(job_id)
-        recent_runs = JobRun.query.filter_by(job_id=job_id).order_by(JobRun.started_at.desc()).limit(5).all()
+        # One statement fetches the latest runs with the job name, served by ix_jobrun_job_started
+        recent_runs = db.session.execute(
+            select(JobRun, Job.name).join(Job).where(JobRun.job_id == job_id)
+            .order_by(JobRun.started_at.desc()).limit(5)
+        ).all()
+        if recent_runs:
+            job_name = recent_runs[0].name
+        else:
+            job_name = db.get_or_404(Job, job_id).name
         
         runs_data = []
-        for run in recent_runs:
+        for run, _ in recent_runs:
             runs_data.append({
                 'id': run.id,
                 'status': run.status,
-                'started_at': run.started_at.strftime('%Y-%m-%d %H:%M:%S'),
-                'completed_at': run.completed_at.strftime('%Y-%m-%d %H:%M:%S') if run.completed_at else None,
+                'started_at': run.started_at,
+                'completed_at': run.completed_at,
                 'results': run.results
             })
         
         return jsonify({
             'job_id': job_id,
-            'job_name': job.name,
+            'job_name': job_name,
             'runs': runs_data
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -193,4 +388,6 @@ def macro_docs():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+    if not app.config['COUNT_QUERIES']:
+        enable_query_counting()
     app.run(debug=True)
\ No newline at end of file
@@ -3,45 +3,235 @@ Web Scraping Engine with Macro Support
 Supports predefined macros for common Selenium operations
 """
 
+import ast
+import atexit
+import functools
 import os
+import threading
 import time
 import json
 import re
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from bs4 import BeautifulSoup
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+
+# Macro pattern: COMMAND(param1='value1', param2='value2')
+_MACRO_RE = re.compile(r"(\w+)\((.*?)\)")
+_PARAM_RE = re.compile(r"(\w+)=(['\"]?)(.*?)\2(?:,|$)")
+
+# One line of a script: a comment, a macro call, or anything else (reported as invalid)
+_PROGRAM_RE = re.compile(
+    r"^[^\S\n]*(?:"
+    r"(?P<comment>(?:#|//).*?)"
+    r"|(?P<command>\w+)\((?P<args>.*?)\).*?"
+    r"|(?P<invalid>\S.*?)"
+    r")\s*$",
+    re.MULTILINE,
+)
+
+# Values of selenium's By.CSS_SELECTOR, By.XPATH, By.ID and By.CLASS_NAME,
+# spelled out so the table doesn't need selenium imported
+_BY = {
+    "css": "css selector",
+    "xpath": "xpath",
+    "id": "id",
+    "class": "class name",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _selenium():
+    """Import selenium on first use so the web process never pays for loading it"""
+    from selenium import webdriver
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions
+    from selenium.webdriver.chrome.options import Options
+    from selenium.common.exceptions import TimeoutException
+    
+    return SimpleNamespace(
+        webdriver=webdriver,
+        WebDriverWait=WebDriverWait,
+        EC=expected_conditions,
+        Options=Options,
+        TimeoutException=TimeoutException,
+    )
+
+def _parse_params(params_str):
+    """Parse a macro's key='value' argument list into a dict"""
+    params = {}
+    if params_str:
+        # Simple parameter parsing (can be enhanced)
+        for param_match in _PARAM_RE.finditer(params_str):
+            key = param_match.group(1)
+            value = param_match.group(3)
+            params[key] = value
+    return params
+
+
+@functools.lru_cache(maxsize=256)
+def parse_program(instructions):
+    """
+    Parse a whole instruction script in a single regex pass.
+    Returns (instruction, parsed) pairs with comments and blank lines dropped;
+    parsed is None for lines that are not valid macro calls.
+    """
+    program = []
+    for match in _PROGRAM_RE.finditer(instructions):
+        if match.group("comment") is not None:
+            continue
+        
+        command = match.group("command")
+        parsed = None
+        if command:
+            parsed = {"command": command.upper(), "params": _parse_params(match.group("args"))}
+        program.append((match.group(0).strip(), parsed))
+    return tuple(program)
+
+
+# Resolves with the scroll offset after the next two animation frames
+_SCROLL_POSITION_JS = """
+const done = arguments[arguments.length - 1];
+requestAnimationFrame(() => requestAnimationFrame(() => done(window.pageYOffset)));
+"""
+SCROLL_SETTLE_TIMEOUT = 0.5
+
+DOWNLOADS_DIR = os.environ.get("DOWNLOADS_DIR", "downloads")
+os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", os.cpu_count() or 1))
+
+
+class DriverPool:
+    """Bounded pool of reusable Chrome WebDriver instances"""
+    
+    def __init__(self, size, headless=True):
+        self.size = size
+        self.headless = headless
+        self._idle = []
+        self._created = 0
+        # Signalled whenever a driver is returned or a slot is freed
+        self._available = threading.Condition()
+        self._chrome_options = None
+
+    def _create_driver(self):
+        selenium = _selenium()
+        # The options never change for a pool, so build them once
+        if self._chrome_options is None:
+            chrome_options = selenium.Options()
+            if self.headless:
+                chrome_options.add_argument("--headless")
+            chrome_options.add_argument("--no-sandbox")
+            chrome_options.add_argument("--disable-dev-shm-usage")
+            chrome_options.add_argument("--disable-gpu")
+            chrome_options.add_argument("--window-size=1920,1080")
+            self._chrome_options = chrome_options
+        return selenium.webdriver.Chrome(options=self._chrome_options)
+
+    def get(self):
+        """Check out an idle driver, launching one lazily while under the pool size"""
+        with self._available:
+            # Pool is at capacity, wait for another job to return a driver or free a slot
+            while not self._idle and self._created >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        
+        try:
+            return self._create_driver()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def put(self, driver):
+        """Reset a driver and return it to the pool, discarding it if the reset fails"""
+        try:
+            self._reset_driver(driver)
+        except Exception:
+            self.discard(driver)
+            return
+        with self._available:
+            self._idle.append(driver)
+            self._available.notify()
+
+    def discard(self, driver):
+        """Quit a driver and free its slot in the pool"""
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        finally:
+            self._release_slot()
+
+    def close(self):
+        """Quit every idle driver so no Chrome process outlives the pool"""
+        with self._available:
+            drivers, self._idle = self._idle, []
+        for driver in drivers:
+            self.discard(driver)
+
+    def _release_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    @staticmethod
+    def _reset_driver(driver):
+        """Close extra windows and clear cookies, cache and storage left by the last job"""
+        handles = driver.window_handles
+        origins = set()
+        for handle in reversed(handles):
+            driver.switch_to.window(handle)
+            # Every origin this window navigated to may have left storage behind
+            history = driver.execute_cdp_cmd("Page.getNavigationHistory", {})
+            for entry in history["entries"]:
+                parts = urlsplit(entry["url"])
+                if parts.scheme in ("http", "https"):
+                    origins.add(f"{parts.scheme}://{parts.netloc}")
+            if handle != handles[0]:
+                driver.close()
+        
+        driver.switch_to.window(handles[0])
+        driver.get("about:blank")
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        for origin in origins:
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+        driver.execute_cdp_cmd("Page.resetNavigationHistory", {})
+
+
+DRIVER_POOLS = {
+    True: DriverPool(DRIVER_POOL_SIZE, headless=True),
+    False: DriverPool(DRIVER_POOL_SIZE, headless=False),
+}
+
+
+@atexit.register
+def shutdown_driver_pools():
+    """Quit the idle drivers of every pool; also hooked to Celery worker process shutdown"""
+    for pool in DRIVER_POOLS.values():
+        pool.close()
 
 
 class ScrapingMacros:
     """Predefined macros for common scraping operations"""
     
     @staticmethod
-    def click_element(driver, selector, selector_type="css"):
+    def click_element(driver, selector, selector_type="css", timeout=10):
         """
-        CLICK_ELEMENT(selector, type='css')
+        CLICK_ELEMENT(selector, type='css', timeout=10)
         Clicks an element found by the given selector
         """
         try:
-            wait = WebDriverWait(driver, 10)
-            if selector_type.lower() == 'css':
-                element = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, selector)))
-            elif selector_type.lower() == 'xpath':
-                element = wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
-            elif selector_type.lower() == 'id':
-                element = wait.until(EC.element_to_be_clickable((By.ID, selector)))
-            elif selector_type.lower() == 'class':
-                element = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, selector)))
-            else:
-                element = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, selector)))
+            selenium = _selenium()
+            wait = selenium.WebDriverWait(driver, timeout)
+            by = _BY.get(selector_type.lower(), _BY["css"])
+            element = wait.until(selenium.EC.element_to_be_clickable((by, selector)))
             
             element.click()
             return {"status": "success", "message": f"Clicked element: {selector}"}
-        except TimeoutException:
+        except _selenium().TimeoutException:
             return {"status": "error", "message": f"Timeout waiting for element: {selector}"}
         except Exception as e:
             return {"status": "error", "message": f"Error clicking element: {str(e)}"}
@@ -65,11 +255,22 @@ class ScrapingMacros:
             elif direction.lower() == "bottom":
                 driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
             
-            time.sleep(1)  # Wait for scroll to complete
+            ScrapingMacros._wait_for_scroll(driver)
             return {"status": "success", "message": f"Scrolled {direction} by {pixels}px"}
         except Exception as e:
             return {"status": "error", "message": f"Error scrolling: {str(e)}"}
 
+    @staticmethod
+    def _wait_for_scroll(driver):
+        """Poll the scroll offset each couple of frames until it settles or the timeout passes"""
+        deadline = time.monotonic() + SCROLL_SETTLE_TIMEOUT
+        position = driver.execute_async_script(_SCROLL_POSITION_JS)
+        while time.monotonic() < deadline:
+            new_position = driver.execute_async_script(_SCROLL_POSITION_JS)
+            if new_position == position:
+                break
+            position = new_position
+
     @staticmethod
     def save_html(driver, filename=None, job_id=None):
         """
@@ -82,17 +283,16 @@ class ScrapingMacros:
                 job_prefix = f"job_{job_id}_" if job_id else ""
                 filename = f"{job_prefix}scraped_{timestamp}.html"
             
-            # Create downloads directory if it doesn't exist
-            downloads_dir = "downloads"
-            if not os.path.exists(downloads_dir):
-                os.makedirs(downloads_dir)
-            
-            filepath = os.path.join(downloads_dir, filename)
+            filepath = os.path.join(DOWNLOADS_DIR, filename)
             
-            # Get page source and save
-            html_content = driver.page_source
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            # Get page source and write the encoded bytes without a buffered text wrapper
+            html_bytes = memoryview(driver.page_source.encode('utf-8'))
+            fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                while html_bytes:
+                    html_bytes = html_bytes[os.write(fd, html_bytes):]
+            finally:
+                os.close(fd)
             
             return {"status": "success", "message": f"HTML saved to: {filepath}", "file": filepath}
         except Exception as e:
@@ -111,32 +311,135 @@ class ScrapingMacros:
             return {"status": "error", "message": f"Error waiting: {str(e)}"}
 
     @staticmethod
-    def extract_text(driver, selector, selector_type="css"):
+    def extract_text(driver, selector, selector_type="css", timeout=10):
         """
-        EXTRACT_TEXT(selector, type='css')
+        EXTRACT_TEXT(selector, type='css', timeout=10)
         Extracts text from an element
         """
         try:
-            wait = WebDriverWait(driver, 10)
-            if selector_type.lower() == 'css':
-                element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-            elif selector_type.lower() == 'xpath':
-                element = wait.until(EC.presence_of_element_located((By.XPATH, selector)))
-            elif selector_type.lower() == 'id':
-                element = wait.until(EC.presence_of_element_located((By.ID, selector)))
-            elif selector_type.lower() == 'class':
-                element = wait.until(EC.presence_of_element_located((By.CLASS_NAME, selector)))
-            else:
-                element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
+            selenium = _selenium()
+            wait = selenium.WebDriverWait(driver, timeout)
+            by = _BY.get(selector_type.lower(), _BY["css"])
+            element = wait.until(selenium.EC.presence_of_element_located((by, selector)))
             
             text = element.text
             return {"status": "success", "message": f"Extracted text from {selector}", "data": text}
-        except TimeoutException:
+        except _selenium().TimeoutException:
             return {"status": "error", "message": f"Timeout waiting for element: {selector}"}
         except Exception as e:
             return {"status": "error", "message": f"Error extracting text: {str(e)}"}
 
 
+# Placeholder in a macro's argument list for the job id supplied at run time
+_JOB_ID = object()
+
+# Maps each macro command to its ScrapingMacros implementation and a builder
+# turning the parsed params into the positional arguments after the driver
+_MACROS = {
+    "CLICK_ELEMENT": (ScrapingMacros.click_element, lambda params: (
+        params.get("selector", ""), params.get("type", "css"), float(params.get("timeout", 10)))),
+    "SCROLL_PAGE": (ScrapingMacros.scroll_page, lambda params: (
+        params.get("direction", "down"), int(params.get("pixels", 500)))),
+    "SAVE_HTML": (ScrapingMacros.save_html, lambda params: (
+        params.get("filename"), _JOB_ID)),
+    "WAIT": (ScrapingMacros.wait_seconds, lambda params: (
+        float(params.get("seconds", 2)),)),
+    "EXTRACT_TEXT": (ScrapingMacros.extract_text, lambda params: (
+        params.get("selector", ""), params.get("type", "css"), float(params.get("timeout", 10)))),
+}
+
+
+def _bind_macro(instruction, parsed):
+    """Resolve a parsed instruction to (macro, args, None), or (None, None, error result)"""
+    if not parsed:
+        return None, None, {"status": "error", "message": f"Invalid instruction format: {instruction}"}
+    
+    command = parsed["command"]
+    if command not in _MACROS:
+        return None, None, {"status": "error", "message": f"Unknown command: {command}"}
+    
+    macro, build_args = _MACROS[command]
+    try:
+        return macro, build_args(parsed["params"]), None
+    except Exception as e:
+        return None, None, {"status": "error", "message": f"Error executing {command}: {str(e)}"}
+
+
+def _name(identifier, ctx=None):
+    return ast.Name(id=identifier, ctx=ctx or ast.Load())
+
+
+def _assign_result(value):
+    return ast.Assign(targets=[_name("result", ast.Store())], value=value)
+
+
+def _error_dict(message):
+    return ast.Dict(keys=[ast.Constant("status"), ast.Constant("message")], values=[ast.Constant("error"), message])
+
+
+def _record_result(instruction):
+    """results.append({"instruction": instruction, "result": result})"""
+    entry = ast.Dict(
+        keys=[ast.Constant("instruction"), ast.Constant("result")],
+        values=[ast.Constant(instruction), _name("result")],
+    )
+    return ast.Expr(ast.Call(
+        func=ast.Attribute(value=_name("results"), attr="append", ctx=ast.Load()), args=[entry], keywords=[]))
+
+
+@functools.lru_cache(maxsize=256)
+def compile_program(instructions):
+    """
+    Compile an instruction script into a Python function calling the macros directly.
+    The function takes (driver, job_id, results), appends one entry to results per
+    instruction and stops at the first error, exactly like executing it step by step.
+    """
+    namespace = {}
+    body = []
+    for instruction, parsed in parse_program(instructions):
+        macro, args, error = _bind_macro(instruction, parsed)
+        if error:
+            body.append(_assign_result(_error_dict(ast.Constant(error["message"]))))
+            body.append(_record_result(instruction))
+            body.append(ast.Return(value=None))
+            break
+        
+        namespace[macro.__name__] = macro
+        call = ast.Call(
+            func=_name(macro.__name__),
+            args=[_name("driver")] + [_name("job_id") if arg is _JOB_ID else ast.Constant(arg) for arg in args],
+            keywords=[],
+        )
+        failure = ast.BinOp(
+            left=ast.Constant(f"Error executing {parsed['command']}: "),
+            op=ast.Add(),
+            right=ast.Call(func=_name("str"), args=[_name("e")], keywords=[]),
+        )
+        body.append(ast.Try(
+            body=[_assign_result(call)],
+            handlers=[ast.ExceptHandler(type=_name("Exception"), name="e", body=[_assign_result(_error_dict(failure))])],
+            orelse=[],
+            finalbody=[],
+        ))
+        body.append(_record_result(instruction))
+        body.append(ast.If(
+            test=ast.Compare(
+                left=ast.Subscript(value=_name("result"), slice=ast.Constant("status"), ctx=ast.Load()),
+                ops=[ast.Eq()],
+                comparators=[ast.Constant("error")],
+            ),
+            body=[ast.Return(value=None)],
+            orelse=[],
+        ))
+    
+    module = ast.parse("def scraping_program(driver, job_id, results):\n    pass")
+    if body:
+        module.body[0].body = body
+    ast.fix_missing_locations(module)
+    exec(compile(module, "<scraping program>", "exec"), namespace)
+    return namespace["scraping_program"]
+
+
 class ScrapingEngine:
     """Main scraping engine that executes macro-based instructions"""
     
@@ -147,86 +450,48 @@ class ScrapingEngine:
         self.results = []
 
     def setup_driver(self):
-        """Initialize Chrome WebDriver"""
+        """Check out a Chrome WebDriver from the shared pool"""
         try:
-            chrome_options = Options()
-            if self.headless:
-                chrome_options.add_argument("--headless")
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            chrome_options.add_argument("--disable-gpu")
-            chrome_options.add_argument("--window-size=1920,1080")
-            
-            self.driver = webdriver.Chrome(options=chrome_options)
+            self.driver = DRIVER_POOLS[bool(self.headless)].get()
             return {"status": "success", "message": "WebDriver initialized"}
         except Exception as e:
             return {"status": "error", "message": f"Failed to initialize WebDriver: {str(e)}"}
 
+    def release_driver(self):
+        """Return the WebDriver to the shared pool for the next job"""
+        if self.driver:
+            DRIVER_POOLS[bool(self.headless)].put(self.driver)
+            self.driver = None
+
     def parse_macro(self, instruction):
         """Parse a macro instruction and extract command and parameters"""
         instruction = instruction.strip()
         
-        # Match macro pattern: COMMAND(param1='value1', param2='value2')
-        pattern = r"(\w+)\((.*?)\)"
-        match = re.match(pattern, instruction)
+        match = _MACRO_RE.match(instruction)
         
         if not match:
             return None
         
         command = match.group(1).upper()
-        params_str = match.group(2)
-        
-        # Parse parameters
-        params = {}
-        if params_str:
-            # Simple parameter parsing (can be enhanced)
-            param_pattern = r"(\w+)=(['\"]?)(.*?)\2(?:,|$)"
-            for param_match in re.finditer(param_pattern, params_str):
-                key = param_match.group(1)
-                value = param_match.group(3)
-                params[key] = value
+        params = _parse_params(match.group(2))
         
         return {"command": command, "params": params}
 
     def execute_instruction(self, instruction, job_id=None):
         """Execute a single macro instruction"""
-        parsed = self.parse_macro(instruction)
-        
-        if not parsed:
-            return {"status": "error", "message": f"Invalid instruction format: {instruction}"}
-        
-        command = parsed["command"]
-        params = parsed["params"]
+        return self.execute_parsed(instruction, self.parse_macro(instruction), job_id)
+
+    def execute_parsed(self, instruction, parsed, job_id=None):
+        """Execute an instruction that has already been parsed"""
+        macro, args, error = _bind_macro(instruction, parsed)
+        if error:
+            return error
         
         try:
-            if command == "CLICK_ELEMENT":
-                selector = params.get("selector", "")
-                selector_type = params.get("type", "css")
-                return self.macros.click_element(self.driver, selector, selector_type)
-            
-            elif command == "SCROLL_PAGE":
-                direction = params.get("direction", "down")
-                pixels = int(params.get("pixels", 500))
-                return self.macros.scroll_page(self.driver, direction, pixels)
-            
-            elif command == "SAVE_HTML":
-                filename = params.get("filename")
-                return self.macros.save_html(self.driver, filename, job_id)
-            
-            elif command == "WAIT":
-                seconds = float(params.get("seconds", 2))
-                return self.macros.wait_seconds(self.driver, seconds)
-            
-            elif command == "EXTRACT_TEXT":
-                selector = params.get("selector", "")
-                selector_type = params.get("type", "css")
-                return self.macros.extract_text(self.driver, selector, selector_type)
-            
-            else:
-                return {"status": "error", "message": f"Unknown command: {command}"}
+            return macro(self.driver, *[job_id if arg is _JOB_ID else arg for arg in args])
         
         except Exception as e:
-            return {"status": "error", "message": f"Error executing {command}: {str(e)}"}
+            return {"status": "error", "message": f"Error executing {parsed['command']}: {str(e)}"}
 
     def run_scraping_job(self, job_data):
         """Execute a complete scraping job"""
@@ -246,24 +511,9 @@ class ScrapingEngine:
             self.driver.get(url)
             self.results.append({"status": "success", "message": f"Navigated to: {url}"})
             
-            # Execute instructions line by line
+            # Run the script through its compiled, cached program
             if instructions:
-                lines = [line.strip() for line in instructions.split('\n') if line.strip()]
-                
-                for line in lines:
-                    # Skip comments
-                    if line.startswith('#') or line.startswith('//'):
-                        continue
-                    
-                    result = self.execute_instruction(line, job_id)
-                    self.results.append({
-                        "instruction": line,
-                        "result": result
-                    })
-                    
-                    # Stop execution if there's an error
-                    if result["status"] == "error":
-                        break
+                compile_program(instructions)(self.driver, job_id, self.results)
             
             return {
                 "status": "success", 
@@ -275,18 +525,18 @@ class ScrapingEngine:
             return {"status": "error", "message": f"Error during scraping: {str(e)}"}
         
         finally:
-            if self.driver:
-                self.driver.quit()
+            self.release_driver()
 
     def get_macro_documentation(self):
         """Return documentation for available macros"""
         return {
             "CLICK_ELEMENT": {
                 "description": "Clicks an element on the page",
-                "syntax": "CLICK_ELEMENT(selector='css_selector', type='css')",
+                "syntax": "CLICK_ELEMENT(selector='css_selector', type='css', timeout=10)",
                 "parameters": {
                     "selector": "CSS selector, XPath, ID, or class name",
-                    "type": "Selector type: 'css', 'xpath', 'id', 'class' (default: 'css')"
+                    "type": "Selector type: 'css', 'xpath', 'id', 'class' (default: 'css')",
+                    "timeout": "Seconds to wait for the element (default: 10)"
                 },
                 "example": "CLICK_ELEMENT(selector='button.submit', type='css')"
             },
@@ -317,10 +567,11 @@ class ScrapingEngine:
             },
             "EXTRACT_TEXT": {
                 "description": "Extracts text from an element",
-                "syntax": "EXTRACT_TEXT(selector='css_selector', type='css')",
+                "syntax": "EXTRACT_TEXT(selector='css_selector', type='css', timeout=10)",
                 "parameters": {
                     "selector": "CSS selector, XPath, ID, or class name",
-                    "type": "Selector type: 'css', 'xpath', 'id', 'class' (default: 'css')"
+                    "type": "Selector type: 'css', 'xpath', 'id', 'class' (default: 'css')",
+                    "timeout": "Seconds to wait for the element (default: 10)"
                 },
                 "example": "EXTRACT_TEXT(selector='h1.title', type='css')"
             }
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+# app.py reads DATABASE_URL at import time, so point it at the test database
+# (or a placeholder when none is configured) before anything imports the app
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+os.environ['DATABASE_URL'] = TEST_DATABASE_URL or 'postgresql+pg8000://localhost/scraper_dashboard_test'
+
+import app as dashboard  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def counting_client():
+    """Test client for an app that reports statement counts in X-Query-Count"""
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    
+    dashboard.app.testing = True
+    dashboard.enable_query_counting()
+    with dashboard.app.app_context():
+        dashboard.db.create_all()
+    yield dashboard.app.test_client()
+    with dashboard.app.app_context():
+        dashboard.db.drop_all()
+
+
+@pytest.fixture
+def add_rows(counting_client):
+    """Commit rows in a short-lived app context so requests start with an empty session"""
+    def add(*rows):
+        with dashboard.app.app_context():
+            dashboard.db.session.add_all(rows)
+            dashboard.db.session.commit()
+    
+    yield add
+    with dashboard.app.app_context():
+        dashboard.db.session.execute(dashboard.text('DELETE FROM job_run'))
+        dashboard.db.session.execute(dashboard.text('DELETE FROM job'))
+        dashboard.db.session.commit()
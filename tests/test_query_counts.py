@@ -0,0 +1,52 @@
+"""N+1 guards: the number of SQL statements each route issues"""
+
+from datetime import datetime, timedelta
+
+from app import Job, JobRun
+
+
+def query_count(response):
+    return int(response.headers['X-Query-Count'])
+
+
+def make_job(job_id, created_at=None):
+    return Job(id=job_id, name=f'Job {job_id}', url=f'https://example.com/{job_id}',
+               selenium_instructions='WAIT(seconds=1)', created_at=created_at or datetime.utcnow())
+
+
+def test_job_status_with_runs_is_one_statement(counting_client, add_rows):
+    started = datetime.utcnow()
+    add_rows(make_job('10001'))
+    add_rows(*[JobRun(job_id='10001', status='completed', results={'status': 'success'},
+                      started_at=started - timedelta(minutes=i)) for i in range(7)])
+    
+    response = counting_client.get('/job_status/10001')
+    
+    assert response.status_code == 200
+    assert response.json['job_name'] == 'Job 10001'
+    assert len(response.json['runs']) == 5
+    assert query_count(response) == 1
+
+
+def test_job_status_without_runs_is_two_statements(counting_client, add_rows):
+    add_rows(make_job('10002'))
+    
+    response = counting_client.get('/job_status/10002')
+    
+    assert response.status_code == 200
+    assert response.json['runs'] == []
+    assert query_count(response) == 2
+
+
+def test_dashboard_page_is_one_statement(counting_client, add_rows):
+    now = datetime.utcnow()
+    job_ids = [str(20000 + i) for i in range(3)]
+    add_rows(*[make_job(job_id, now - timedelta(minutes=i)) for i, job_id in enumerate(job_ids)])
+    add_rows(*[JobRun(job_id=job_id, status='completed') for job_id in job_ids])
+    
+    response = counting_client.get('/')
+    
+    assert response.status_code == 200
+    for job_id in job_ids:
+        assert job_id.encode() in response.data
+    assert query_count(response) == 1
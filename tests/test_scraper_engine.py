@@ -0,0 +1,96 @@
+"""compile_program and parse_program must behave exactly like running the script line by line"""
+
+import pytest
+
+import scraper_engine
+from scraper_engine import ScrapingEngine, compile_program, parse_program
+
+
+class FakeDriver:
+    """Records the scripts a macro runs; scroll offset never changes so scrolls settle at once"""
+    
+    page_source = "<html><body>fake</body></html>"
+    
+    def __init__(self):
+        self.calls = []
+    
+    def execute_script(self, script):
+        self.calls.append(script)
+    
+    def execute_async_script(self, script):
+        return 0
+
+
+def run_line_by_line(instructions, job_id):
+    """The original interpreter loop, built on ScrapingEngine.execute_instruction"""
+    engine = ScrapingEngine()
+    engine.driver = FakeDriver()
+    results = []
+    for line in [line.strip() for line in instructions.split('\n') if line.strip()]:
+        if line.startswith('#') or line.startswith('//'):
+            continue
+        
+        result = engine.execute_instruction(line, job_id)
+        results.append({"instruction": line, "result": result})
+        if result["status"] == "error":
+            break
+    return results, engine.driver.calls
+
+
+def run_compiled(instructions, job_id):
+    driver = FakeDriver()
+    results = []
+    compile_program(instructions)(driver, job_id, results)
+    return results, driver.calls
+
+
+SCRIPTS = {
+    "empty": "",
+    "only comments and blank lines": "# setup\n\n   \n// nothing to do\n",
+    "comments between commands": "SCROLL_PAGE(direction='down', pixels=300)\n# then\n\n// and\nSCROLL_PAGE(direction='top')",
+    "crlf and leading whitespace": "\r\n  SCROLL_PAGE(direction='up', pixels=20)\r\n\t WAIT(seconds=0)\r\n",
+    "lowercase command and trailing text": "scroll_page(direction=\"bottom\") then stop",
+    "save html": "SAVE_HTML(filename='page.html')\nWAIT(seconds=0)",
+    "invalid line": "SCROLL_PAGE(pixels=10)\nthis is not a macro\nSCROLL_PAGE(pixels=20)",
+    "unknown command": "WAIT(seconds=0)\nFLY_AWAY(height=10)\nSCROLL_PAGE(pixels=20)",
+    "pixels conversion error": "SCROLL_PAGE(direction='down', pixels=abc)\nSCROLL_PAGE(pixels=20)",
+    "seconds conversion error": "SCROLL_PAGE(pixels=5)\nWAIT(seconds=x)\nSCROLL_PAGE(pixels=20)",
+    "macro reports error": "SAVE_HTML(filename='missing/dir/page.html')\nSCROLL_PAGE(pixels=20)",
+}
+
+
+@pytest.fixture(autouse=True)
+def downloads_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper_engine, "DOWNLOADS_DIR", str(tmp_path))
+
+
+@pytest.mark.parametrize("instructions", SCRIPTS.values(), ids=SCRIPTS.keys())
+def test_compiled_program_matches_line_by_line(instructions):
+    assert run_compiled(instructions, "12345") == run_line_by_line(instructions, "12345")
+
+
+@pytest.mark.parametrize("instructions", SCRIPTS.values(), ids=SCRIPTS.keys())
+def test_parse_program_matches_parse_macro(instructions):
+    engine = ScrapingEngine()
+    expected = [
+        (line, engine.parse_macro(line))
+        for line in [line.strip() for line in instructions.split('\n') if line.strip()]
+        if not (line.startswith('#') or line.startswith('//'))
+    ]
+    
+    assert list(parse_program(instructions)) == expected
+
+
+def test_stops_at_first_error():
+    results, calls = run_compiled(SCRIPTS["unknown command"], "12345")
+    
+    assert [entry["result"]["status"] for entry in results] == ["success", "error"]
+    assert results[-1]["result"]["message"] == "Unknown command: FLY_AWAY"
+    assert calls == []
+
+
+def test_conversion_error_message():
+    results, _ = run_compiled(SCRIPTS["pixels conversion error"], "12345")
+    
+    assert len(results) == 1
+    assert results[0]["result"]["message"].startswith("Error executing SCROLL_PAGE: invalid literal for int()")
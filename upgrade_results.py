@@ -0,0 +1,49 @@
+"""
+One-off upgrade for databases created before JobRun.results became JSONB.
+Older rows hold the Python repr() of the result dict, which is not valid JSON,
+so each value is parsed with ast.literal_eval and rewritten as JSONB.
+
+Usage: python upgrade_results.py   (uses the same DATABASE_URL as the app)
+"""
+
+import ast
+
+from sqlalchemy import bindparam, text, update
+
+from app import app, db, JobRun
+
+
+def convert_legacy_results(raw):
+    """Turn a stored repr() string back into the dict it came from"""
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        # Keep anything unparseable rather than dropping it
+        return {"legacy_results": raw}
+
+
+def main():
+    with app.app_context(), db.engine.begin() as conn:
+        column_type = conn.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'job_run' AND column_name = 'results'"
+        )).scalar()
+        if column_type == 'jsonb':
+            print('job_run.results is already JSONB, nothing to do')
+            return
+        
+        rows = conn.execute(text("SELECT id, results FROM job_run WHERE results IS NOT NULL")).all()
+        conn.execute(text("ALTER TABLE job_run ALTER COLUMN results TYPE jsonb USING NULL"))
+        
+        converted = [{'run_id': run_id, 'new_results': convert_legacy_results(raw)} for run_id, raw in rows]
+        if converted:
+            table = JobRun.__table__
+            conn.execute(
+                update(table).where(table.c.id == bindparam('run_id')).values(results=bindparam('new_results')),
+                converted
+            )
+        print(f'Converted {len(converted)} job runs to JSONB')
+
+
+if __name__ == '__main__':
+    main()